@@ -1,20 +1,44 @@
-import base64
+import functools
 import io
 import json
 import logging
 import os
+import sys
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
 from string import Template
-from typing import Dict, List, Sequence, Tuple, Union
-
-import matplotlib
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import yaml
-from markdown import markdown
-
-logging.basicConfig(level=logging.INFO)
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+# markdown and pandas are imported where they're used, DataTable is handed a
+# DataFrame by the caller so pandas is only needed here for the annotation
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    # simd accelerated drop-in replacement, used to inline matplotlib plots
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# log messages are formatted lazily, so at the default WARNING level the per component
+# logging costs next to nothing. Set RC_LOG_LEVEL=INFO to see them, an unknown level
+# falls back to WARNING rather than failing the import.
+_log_level = logging.getLevelName(os.environ.get("RC_LOG_LEVEL", "WARNING").upper())
+logging.basicConfig(
+    level=_log_level if isinstance(_log_level, int) else logging.WARNING
+)
 
 
 def strip_whitespace(func):
@@ -29,24 +53,145 @@ def strip_whitespace(func):
 
     """
 
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        result = func(*args, **kwargs)
-        if isinstance(result, str):
-            return result.strip()
-        else:
-            return result
+        return func(*args, **kwargs).strip()
 
     return wrapper
 
 
+def memoize_html(func):
+    """
+    A decorator that caches the result of a component's to_html on the component.
+
+    Components are treated as immutable once built, so the html is rendered the first
+    time it's asked for and reused after that, e.g. when a report is saved twice.
+
+    Args:
+        func: The to_html method to be decorated.
+
+    Returns:
+        The decorated method.
+
+    """
+
+    @functools.wraps(func)
+    def wrapper(self):
+        # getattr, subclasses aren't required to call Base.__init__
+        html = getattr(self, "_html", None)
+        if html is None:
+            html = self._html = func(self)
+        return html
+
+    return wrapper
+
+
+_render_pool = None
+_render_state = threading.local()
+
+
+def _render_in_pool(component):
+    # anything rendered on a pool thread renders its own children serially, otherwise
+    # nested containers would block waiting on the pool they're running on
+    _render_state.in_pool = True
+    return component.to_html()
+
+
+def _render_components(components) -> List[str]:
+    """
+    Render each component to html, preserving order.
+
+    Rendering is serial unless the environment variable RC_PARALLEL_RENDER=1 is set, in
+    which case independent components are rendered on a shared thread pool. This helps
+    when the components spend their time in code that releases the GIL (matplotlib,
+    plotly, pandas).
+
+    Args:
+        components: The components to render.
+
+    Returns:
+        The html for each component.
+
+    """
+    global _render_pool
+
+    if not _use_render_pool(components):
+        return [component.to_html() for component in components]
+
+    if _render_pool is None:
+        _render_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+    return list(_render_pool.map(_render_in_pool, components))
+
+
+def _use_render_pool(components) -> bool:
+    return (
+        os.environ.get("RC_PARALLEL_RENDER") == "1"
+        and len(components) >= 2
+        and not getattr(_render_state, "in_pool", False)
+    )
+
+
+def _iter_components(components) -> Iterator[Iterable[str]]:
+    """
+    The html fragments of each component, preserving order, see Base.iter_html.
+
+    When rendering in parallel (see _render_components) the components are rendered up
+    front on the thread pool, otherwise each one is streamed as it's reached.
+
+    Args:
+        components: The components to render.
+
+    Returns:
+        An iterator over the html fragments of each component.
+
+    """
+    if _use_render_pool(components):
+        return ([html] for html in _render_components(components))
+
+    return (component.iter_html() for component in components)
+
+
+# the client side libraries with an include in templates/<name>.html, see Base.REQUIRES
+_INCLUDES = frozenset({"datatable", "hljs", "plotly"})
+
+
 class Base(ABC):
+    # client side libraries (see templates/<name>.html) the rendered html depends on
+    REQUIRES: FrozenSet[str] = frozenset()
+
     def __init__(self, label: str = None):
         self.label = label
+        self._html = None
 
     @abstractmethod
-    def to_html(self):
+    def to_html(self) -> str:
         """Each component that derives from Base must implement this method"""
 
+    def iter_html(self) -> Iterator[str]:
+        """
+        The html for this component as a sequence of fragments.
+
+        Containers override this to yield their children's fragments lazily, so a
+        report can be written out without joining the whole body, or any container's
+        html, into one string. A streamed container's own html isn't memoized for the
+        same reason.
+
+        The leaf components are still memoized by to_html though, so after a save the
+        component tree holds the html of every leaf, roughly the size of the body. That
+        is traded for not rendering the leaves again on the next save or to_html call,
+        what streaming saves is the joined copies that would come on top of it.
+
+        Returns:
+            An iterator over html fragments, which joined together equal to_html().
+
+        """
+        yield self.to_html()
+
+    def requires(self) -> FrozenSet[str]:
+        """The client side libraries needed to display this component"""
+        return self.REQUIRES
+
 
 ##############################
 
@@ -55,8 +200,9 @@ class InfoBox(Base):
     def __init__(self, prompt: str, label=None):
         Base.__init__(self, label=label)
         self.text = text
-        logging.info(f"InfoBox {len(self.text)} characters")
+        logging.info("InfoBox %d characters", len(self.text))
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
         return f"""
@@ -69,73 +215,101 @@ class InfoBox(Base):
 ##############################
 
 
-class Block(Base):
-    # vertically stacked compoments
-    def __init__(self, *components: Base):
-        Base.__init__(self)
+class _Container(Base):
+    # a component made of other components. Subclasses provide the markup around their
+    # children in _iter_parts, which to_html and iter_html are both built from. A
+    # subclass may still override to_html, in which case iter_html defers to it
+    def __init__(self, *components: Base, label: str = None):
+        Base.__init__(self, label=label)
         self.components = components
-        logging.info(f"Block: {len(self.components)} components")
 
-    @strip_whitespace
+    def requires(self) -> FrozenSet[str]:
+        return self.REQUIRES.union(*[c.requires() for c in self.components])
+
+    @abstractmethod
+    def _iter_parts(self, children: Iterable[Iterable[str]]) -> Iterator[str]:
+        """
+        The html for this container as a sequence of fragments.
+
+        Args:
+            children: The html fragments of each child component, in order. to_html
+                passes each child's rendered html, iter_html each child's fragments.
+
+        Returns:
+            An iterator over html fragments.
+
+        """
+
+    @memoize_html
     def to_html(self):
-        html = "<block>"
+        return "".join(
+            self._iter_parts([html] for html in _render_components(self.components))
+        )
 
-        for component in self.components:
-            html += "<block-article>"
-            html += component.to_html()
-            html += "</block-article>"
+    def iter_html(self) -> Iterator[str]:
+        # a subclass that overrides to_html may change the markup, so it's rendered
+        # whole, otherwise saving would silently drop the override
+        if (
+            getattr(self, "_html", None) is not None
+            or type(self).to_html is not _Container.to_html
+        ):
+            yield self.to_html()
+        else:
+            yield from self._iter_parts(_iter_components(self.components))
 
-        html += "</block>"
 
-        return html
+##############################
+
+
+class Block(_Container):
+    # vertically stacked compoments
+    def __init__(self, *components: Base):
+        _Container.__init__(self, *components)
+        logging.info("Block: %d components", len(self.components))
+
+    def _iter_parts(self, children: Iterable[Iterable[str]]) -> Iterator[str]:
+        yield "<block>"
+        for child in children:
+            yield "<block-article>"
+            yield from child
+            yield "</block-article>"
+        yield "</block>"
 
 
 ##############################
 
 
-class Group(Base):
+class Group(_Container):
     # horizontally stacked compoments
     def __init__(self, *components: Base, label=None):
-        Base.__init__(self, label=label)
-        self.components = components
-        logging.info(f"Group: {len(self.components)} components {label=}")
+        _Container.__init__(self, *components, label=label)
+        logging.info("Group: %d components label=%r", len(self.components), label)
 
-    @strip_whitespace
-    def to_html(self):
-        html = "<group>"
+    def _iter_parts(self, children: Iterable[Iterable[str]]) -> Iterator[str]:
+        yield "<group>"
         if self.label:
-            html += f"<report_caption>{self.label}</report_caption>"
-
-        html += "<group-component>"
-        for component in self.components:
-            html += "<group-article>"
-            html += component.to_html()
-            html += "</group-article>"
-
-        html += "</group-component>"
-        html += "</group>"
-
-        return html
+            yield f"<report_caption>{self.label}</report_caption>"
+        yield "<group-component>"
+        for child in children:
+            yield "<group-article>"
+            yield from child
+            yield "</group-article>"
+        yield "</group-component></group>"
 
 
 ##############################
 
 
-class Collapse(Base):
+class Collapse(_Container):
     def __init__(self, *components: Base, label: str = None):
-        Base.__init__(self, label=label)
-        self.components = components
-        logging.info(f"Collapse {len(self.components)} components, {label=}")
+        _Container.__init__(self, *components, label=label)
+        logging.info("Collapse %d components, label=%r", len(self.components), label)
 
-    @strip_whitespace
-    def to_html(self):
-        html = f"<details><summary>{self.label}</summary>"
-
-        for component in self.components:
-            html += component.to_html()
-
-        html += "</details>"
-        return html
+    def _iter_parts(self, children: Iterable[Iterable[str]]) -> Iterator[str]:
+        yield f"<details><summary>{self.label}</summary>"
+        for child in children:
+            yield from child
+        yield "</details>"
 
 
 ##############################
@@ -149,8 +323,9 @@ class Statistic(Base):
         self.heading = heading
         self.value = value
         self.unit = unit or ""
-        logging.info(f"Statistic {self.heading} {self.value}")
+        logging.info("Statistic %s %s", self.heading, self.value)
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
         return f"""
@@ -165,44 +340,75 @@ class Statistic(Base):
 
 
 class DataTable(Base):
+    REQUIRES = frozenset({"datatable"})
+
     def __init__(
         self,
-        df: pd.DataFrame,
+        df: "pd.DataFrame",
         label=None,
         max_rows: int = -1,
         **kwargs,
     ):
         Base.__init__(self, label=label)
 
-        if max_rows > 0:
-            styler = df.head(max_rows).style
-        else:
-            styler = df.style
-
-        if label:
-            styler.set_caption(label)
-
-        styler.hide(axis="index")
-        styler.set_table_attributes(
-            'class="fancy_table display nowrap" style="width: 100%;"'
-        )
-        self.table_html = styler.to_html()
-        logging.info(f"DataTable {len(df)} rows")
+        # rendering is deferred until (and unless) the table is actually rendered, the
+        # copy snapshots the frame so later changes to the caller's frame don't show up
+        # in the report. Copying is cheap next to rendering it
+        self.df = (df.head(max_rows) if max_rows > 0 else df).copy()
+        logging.info("DataTable %d rows", len(df))
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
-        return f"<div class='dataTables_wrapper'>{self.table_html}</div>"
+        # DataFrame.to_html is many times faster than going through a Styler, which
+        # formats every cell in python, and nothing here needs per-cell styling
+        table_html = self.df.to_html(
+            index=False,
+            border=0,
+            classes="fancy_table display nowrap",
+        )
+
+        # to_html can't set an inline style or a caption, so add them after the
+        # opening table tag
+        table_open, table_rest = table_html.split(">", 1)
+        caption = f"<caption>{self.label}</caption>" if self.label else ""
+
+        return (
+            f"""<div class='dataTables_wrapper'>{table_open} style="width: 100%;">"""
+            f"{caption}{table_rest}</div>"
+        )
 
 
 ##############################
 
 
 class Html(Base):
-    def __init__(self, html: str, label=None):
+    # raw html can't be inspected for what it needs, so callers name any client side
+    # libraries it depends on, e.g. requires=("hljs",) for <pre><code> blocks or
+    # requires=("datatable",) for a table.fancy_table
+    def __init__(self, html: str, label=None, requires: Sequence[str] = ()):
         Base.__init__(self, label=label)
         self.html = html
-        logging.info(f"Html {len(self.html)} characters")
 
+        # a bare string would otherwise be taken as a sequence of one letter names
+        if isinstance(requires, str):
+            raise ValueError(
+                f"Expected requires to be a sequence of names, got {requires!r}, "
+                f"try requires=({requires!r},)"
+            )
+        unknown = set(requires) - _INCLUDES
+        if unknown:
+            raise ValueError(
+                f"Unknown client side libraries {sorted(unknown)}, "
+                f"expected any of {sorted(_INCLUDES)}"
+            )
+        self.extra_requires = frozenset(requires)
+        logging.info("Html %d characters", len(self.html))
+
+    def requires(self) -> FrozenSet[str]:
+        return self.REQUIRES | self.extra_requires
+
+    @memoize_html
     @strip_whitespace
     def to_html(self):
         return self.html
@@ -215,8 +421,9 @@ class Image(Base):
     def __init__(self, img: str, label=None):
         Base.__init__(self, label=label or img)
         self.img = img
-        logging.info(f"Image URL {img}, label: {self.label}")
+        logging.info("Image URL %s, label: %s", img, self.label)
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
         return f"""
@@ -230,35 +437,57 @@ class Image(Base):
 
 
 class Markdown(Base):
+    # fenced code blocks are highlighted client side
+    REQUIRES = frozenset({"hljs"})
+
+    # one converter is shared by every block, building one loads all the extensions.
+    # converters hold per-document state, so the lock keeps concurrent conversions apart
+    renderer = None
+    renderer_lock = threading.Lock()
+
     def __init__(self, text: str, label=None):
         Base.__init__(self, label=label)
         self.text = text
-        logging.info(f"Markdown {len(self.text)} characters")
+        # the text can't change after construction so it's only converted once
+        self.markdown_html = Markdown.markdown_to_html(self.text)
+        logging.info("Markdown %d characters", len(self.text))
 
     @staticmethod
     def markdown_to_html(text):
-        return markdown(
-            text,
-            extensions=[
-                "markdown.extensions.fenced_code",
-                "markdown.extensions.tables",
-                "markdown_checklist.extension",
-            ],
-        ).strip()
+        with Markdown.renderer_lock:
+            if Markdown.renderer is None:
+                import markdown
+
+                Markdown.renderer = markdown.Markdown(
+                    extensions=[
+                        "markdown.extensions.fenced_code",
+                        "markdown.extensions.tables",
+                        "markdown_checklist.extension",
+                    ]
+                )
+
+            return Markdown.renderer.reset().convert(text).strip()
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
-        html = """<div class='markdown_wrapper'>"""
+        parts = ["""<div class='markdown_wrapper'>"""]
         if self.label:
-            html += f"<h3 class='block-bordered'>{self.label}</h3><br/>"
-        html += Markdown.markdown_to_html(self.text)
-        html += "</div>"
-        return html
+            parts.append(f"<h3 class='block-bordered'>{self.label}</h3><br/>")
+        parts.append(self.markdown_html)
+        parts.append("</div>")
+        return "".join(parts)
 
 
 ##############################
 
 
+def _is_instance(obj, module_name: str, class_name: str) -> bool:
+    # obj can only be an instance of the class if its module has already been imported
+    module = sys.modules.get(module_name)
+    return module is not None and isinstance(obj, getattr(module, class_name))
+
+
 class Plot(Base):
     # see https://plotly.com/python/interactive-html-export/
     # for how to make interactive
@@ -270,40 +499,57 @@ class Plot(Base):
         #         f"Expected matplotlib.figure.Figure, got {type(fig)}, try obj.get_figure()"
         #     )
         self.fig = fig
-        logging.info(f"Plot")
+        logging.info("Plot")
 
-    @strip_whitespace
-    def to_html(self) -> str:
-        html = "<div class='plot_wrapper'>"
+    def requires(self) -> FrozenSet[str]:
+        if _is_instance(self.fig, "plotly.graph_objs._figure", "Figure"):
+            return self.REQUIRES | {"plotly"}
 
-        if self.label:
-            html += f"<h3 class='block-bordered'>{self.label}</h3><br/>"
+        return self.REQUIRES
 
-        if isinstance(self.fig, matplotlib.figure.Figure):
+    def figure_to_html(self) -> str:
+        # matplotlib and plotly are slow to import and a report may not contain any plots,
+        # or only one kind, so the figure's type is checked without importing either
+        if _is_instance(self.fig, "matplotlib.figure", "Figure"):
             tmp = io.BytesIO()
             self.fig.set_figwidth(10)
             self.fig.tight_layout()
-            self.fig.savefig(tmp, format="png")
-            tmp.seek(0)
-            b64image = (
-                base64.b64encode(tmp.getvalue()).decode("utf-8").replace("\n", "")
-            )
-            html += f'<br/><img src="data:image/png;base64,{b64image}">'
+            # zlib's default level is several times slower to encode for little
+            # gain in size on plots, which are mostly flat color
+            self.fig.savefig(tmp, format="png", pil_kwargs={"compress_level": 1})
+            # encode straight from the buffer without copying it, b64encode never
+            # inserts newlines and its output is plain ascii
+            b64image = base64.b64encode(tmp.getbuffer()).decode("ascii")
+            return f'<br/><img src="data:image/png;base64,{b64image}">'
         else:
-            import plotly
-
-            if isinstance(self.fig, plotly.graph_objs._figure.Figure):
-                tmp = io.StringIO()
-                self.fig.write_html(tmp)
-                html += tmp.getvalue()
+            if _is_instance(self.fig, "plotly.graph_objs._figure", "Figure"):
+                # the figure was validated by plotly as it was built, and plotly's json
+                # engine picks up orjson automatically when it's installed. plotly.js is
+                # loaded once in the page head (see requires) rather than inlining the
+                # ~3MB bundle into the page for every figure
+                return self.fig.to_html(
+                    include_plotlyjs=False,
+                    full_html=False,
+                    include_mathjax=False,
+                    validate=False,
+                )
             else:
                 raise ValueError(
                     f"Expected matplotlib.figure.Figure, got {type(self.fig)}, try obj.get_figure()"
                 )
 
-        html += "</div>"
+    @memoize_html
+    @strip_whitespace
+    def to_html(self) -> str:
+        parts = ["<div class='plot_wrapper'>"]
 
-        return html
+        if self.label:
+            parts.append(f"<h3 class='block-bordered'>{self.label}</h3><br/>")
+
+        parts.append(self.figure_to_html())
+        parts.append("</div>")
+
+        return "".join(parts)
 
 
 ##############################
@@ -312,8 +558,9 @@ class Plot(Base):
 class Separator(Base):
     def __init__(self, label: str = None):
         Base.__init__(self, label=label)
-        logging.info(f"Separator")
+        logging.info("Separator")
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
         if self.label:
@@ -329,17 +576,19 @@ class Text(Base):
     def __init__(self, text: str, label=None):
         Base.__init__(self, label=label)
         self.text = text
-        logging.info(f"Text {len(self.text)} characters")
+        logging.info("Text %d characters", len(self.text))
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
-        title = f"title='{self.label}'" if self.label else ""
-
-        formatted_text = "\n\n".join(
-            [
-                f"<p class='indented-text-block'>{p.strip()}</p>"
-                for p in self.text.split("\n\n")
-            ]
+        # like Block, join the paragraphs on the tags between them rather than
+        # formatting each paragraph separately
+        formatted_text = (
+            "<p class='indented-text-block'>"
+            + "</p>\n\n<p class='indented-text-block'>".join(
+                [p.strip() for p in self.text.split("\n\n")]
+            )
+            + "</p>"
         )
 
         if self.label:
@@ -353,54 +602,63 @@ class Text(Base):
 ##############################
 
 
-class Select(Base):
+class Select(_Container):
     def __init__(self, *components: Base):
-        self.components = components
+        _Container.__init__(self, *components)
         for component in self.components:
             if not component.label:
                 raise ValueError("All components must have a label to use in a Select")
 
+        # the tab bar only needs the labels
+        self.labels = [component.label for component in self.components]
+
         logging.info(
-            f"Select {len(self.components)} components: {', '.join([c.label for c in self.components])}"
+            "Select %d components: %s", len(self.components), ", ".join(self.labels)
         )
 
-    @strip_whitespace
-    def to_html(self):
+    def _iter_parts(self, children: Iterable[Iterable[str]]) -> Iterator[str]:
         # assemble the button bar for the tabs
-        html = """<div class="tab">"""
-        for i, component in enumerate(self.components):
-            logging.info(f"creating tab: {component.label}")
+        yield """<div class="tab">"""
+        # labels are escaped once and reused by both loops, the onclick argument is
+        # a js string literal inside an html attribute so it needs both escapings
+        ids = [escape(label) for label in self.labels]
+        for i, (label, tab_id) in enumerate(zip(self.labels, ids)):
+            logging.info("creating tab: %s", label)
             extra = "id='defaultOpen'" if i == 0 else ""
-            html += f"""<button class="tablinks" onclick="openTab(event, '{component.label}')" {extra}>{component.label}</button>"""
-        html += """</div>"""
+            onclick = f"openTab(event, {escape(json.dumps(label))})"
+            yield f"""<button class="tablinks" onclick="{onclick}" {extra}>{tab_id}</button>"""
+        yield """</div>"""
 
         # assemble the tab contents
-        for component in self.components:
-            html += f"""<div id="{component.label}" class="tabcontent">"""
-            html += component.to_html()
-            html += """</div>"""
-
-        return html
+        for tab_id, child in zip(ids, children):
+            yield f"""<div id="{tab_id}" class="tabcontent">"""
+            yield from child
+            yield """</div>"""
 
 
 ##############################
 
 
 class Language(Base):
+    REQUIRES = frozenset({"hljs"})
+
     def __init__(self, text: str, language: str, label=None):
         Base.__init__(self, label=label)
         self.text = text
         self.language = language
-        logging.info(f"{language} {len(self.text)} characters")
+        logging.info("%s %d characters", language, len(self.text))
 
+    @memoize_html
     @strip_whitespace
     def to_html(self):
+        # escaped here rather than in __init__ so blocks that are never rendered
+        # don't pay for a full copy of the text
+        code = escape(self.text.strip(), quote=False)
+
         if self.label:
-            formatted_text = f"<pre><code class='language-{self.language}'>### {self.label}\n\n{self.text.strip()}</code></pre>"
-        else:
-            formatted_text = f"<pre><code class='language-{self.language}'>{self.code.strip()}</code></pre>"
+            code = f"### {escape(self.label, quote=False)}\n\n{code}"
 
-        return f"""<div>{formatted_text}</div>"""
+        return f"<div><pre><code class='language-{self.language}'>{code}</code></pre></div>"
 
 
 ##############################
@@ -416,9 +674,17 @@ class Python(Language):
 
 class Yaml(Language):
     def __init__(self, data: Union[Dict, List], label=None):
+        import yaml
+
+        try:
+            # the libyaml bindings are much faster than the pure python emitter
+            from yaml import CDumper as Dumper
+        except ImportError:
+            from yaml import Dumper
+
         Language.__init__(
             self,
-            yaml.dump(data, indent=2),
+            yaml.dump(data, indent=2, Dumper=Dumper),
             "yaml",
             label=label,
         )
@@ -443,10 +709,58 @@ class Json(Language):
 ##############################
 
 
+@functools.lru_cache(maxsize=None)
+def _load_template(name: str) -> Tuple[Template, Template]:
+    """
+    Read a page template once and split it around the body placeholder.
+
+    Args:
+        name: The file name of the template in the templates directory.
+
+    Returns:
+        The templates for the html before and after the body.
+
+    """
+    current_path = os.path.dirname(os.path.abspath(__file__))
+
+    with open(f"{current_path}/templates/{name}", "r") as f:
+        head, tail = f.read().split("${body}")
+
+    return Template(head), Template(tail)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_include(name: str) -> str:
+    """
+    Read the html that loads a client side library, see Base.REQUIRES.
+
+    Args:
+        name: The name of the library, matching a file in the templates directory.
+
+    Returns:
+        The html to include in the page head.
+
+    """
+    current_path = os.path.dirname(os.path.abspath(__file__))
+
+    with open(f"{current_path}/templates/{name}.html", "r") as f:
+        include = f.read().strip()
+
+    if name == "plotly":
+        # plotly.js has to match the plotly version the figures were built with
+        import plotly.offline
+
+        include = Template(include).substitute(
+            plotlyjs_version=plotly.offline.get_plotlyjs_version()
+        )
+
+    return include
+
+
 class ReportCreator:
     def __init__(self, title: str):
         self.title = title
-        logging.info(f"ReportCreator {self.title}")
+        logging.info("ReportCreator %s", self.title)
 
     def __enter__(self):
         return self
@@ -454,31 +768,51 @@ class ReportCreator:
     def __exit__(self, exc_type, exc_value, exc_traceback):
         pass
 
-    def save(self, view: Base, path: str, format=True) -> None:
+    def save(self, view: Base, path: str, format=False) -> None:
         if not isinstance(view, (Block, Group)):
             raise ValueError(
                 f"Expected view to be either Block, or Group object, got {type(view)} instead"
             )
-        logging.info(f"Saving report to {path}")
+        logging.info("Saving report to %s", path)
+
+        # only load the client side libraries the components actually use
+        includes = "\n\n    ".join(_load_include(name) for name in sorted(view.requires()))
 
-        current_path = os.path.dirname(os.path.abspath(__file__))
+        # the template is split around the body so the (potentially very large)
+        # body is written as-is rather than copied into one document string
+        head, tail = (
+            t.substitute(title=self.title, includes=includes)
+            for t in _load_template("default.html")
+        )
 
-        with open(f"{current_path}/templates/default.html", "r") as f:
-            t = Template(f.read())
-            with open(path, "w") as f:
-                html = t.substitute(
-                    title=self.title,
-                    body=view.to_html(),
+        if format:
+            # lxml is optional and only needed here, so it's not imported until a
+            # formatted report is asked for
+            try:
+                import lxml.html
+            except ImportError:
+                logging.warning("lxml is not installed, saving %s unformatted", path)
+                format = False
+
+        # the template declares utf-8, so write it that way whatever the platform default
+        with open(path, "w", encoding="utf-8") as f:
+            if format:
+                # if lxml is installed we'll use it to prettify the generated html,
+                # its C serializer is far quicker than reparsing with beautifulsoup4
+                doc = lxml.html.document_fromstring(head + view.to_html() + tail)
+                f.write(
+                    lxml.html.tostring(
+                        doc,
+                        doctype="<!DOCTYPE html>",
+                        pretty_print=True,
+                        encoding="unicode",
+                    )
                 )
-                if format:
-                    try:
-                        # if beautifulsoup4 is installed we'll use it to prettify the generated html
-                        from bs4 import BeautifulSoup as bs
-
-                        soup = bs(html, features="lxml")
-                        f.write(soup.prettify())
-                    except ImportError:
-                        f.write(html)
-
-                else:
-                    f.write(html)
+            else:
+                # stream the body fragment by fragment rather than joining it into
+                # one string first
+                f.write(head)
+                f.writelines(view.iter_html())
+                f.write(tail)
+
+        logging.info("Saved report to %s (%d bytes)", path, os.path.getsize(path))
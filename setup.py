@@ -46,6 +46,9 @@ setup(
     keywords="python, html, reports, report, creator, generator, markdown, yaml, plot, chart, table",
     url="https://github.com/darenr/report_creator",
     packages=find_packages(),
+    extras_require={
+        "fast": ["orjson", "pybase64"],
+    },
     long_description=long_description,
     long_description_content_type="text/markdown",
     classifiers=[